@@ -1,11 +1,11 @@
 import streamlit as st
 import speech_recognition as sr
 import pyttsx3
-import ollama
 import time
 import json
 import os
 from datetime import datetime
+from ollama_pool import configured_hosts, create_pool, pooled_chat
 
 # Page configuration
 st.set_page_config(
@@ -114,6 +114,24 @@ st.markdown("""
 # Memory storage file
 MEMORY_FILE = "conversation_memory.json"
 
+# Prompt layout settings
+# The prompt is kept prefix-stable (system prompt -> pinned summary -> append-only
+# turns) so Ollama can reuse its KV cache. The turn window only rolls forward in
+# large steps once it grows past CONTEXT_WINDOW_MAX messages.
+SYSTEM_PROMPT = (
+    "You are a helpful voice assistant. Keep answers short and conversational, "
+    "since they will be spoken aloud."
+)
+CONTEXT_WINDOW_MAX = 24
+CONTEXT_WINDOW_KEEP = 8
+SUMMARY_MAX_TOPICS = 10
+OLLAMA_KEEP_ALIVE = "30m"
+
+# Ollama hosts
+# Set OLLAMA_HOSTS to a comma-separated list to spread conversations across
+# several Ollama servers, e.g. "http://localhost:11434,http://localhost:11435"
+OLLAMA_HOSTS = configured_hosts()
+
 # Initialize session state
 if 'conversation_history' not in st.session_state:
     st.session_state.conversation_history = []
@@ -129,6 +147,16 @@ if 'memory_enabled' not in st.session_state:
     st.session_state.memory_enabled = True
 if 'current_session_id' not in st.session_state:
     st.session_state.current_session_id = None
+if 'context_start' not in st.session_state:
+    st.session_state.context_start = 0
+if 'pinned_summary' not in st.session_state:
+    st.session_state.pinned_summary = []
+if 'prompt_stats' not in st.session_state:
+    st.session_state.prompt_stats = []
+if 'cached_context_tokens' not in st.session_state:
+    st.session_state.cached_context_tokens = 0
+if 'ollama_host' not in st.session_state:
+    st.session_state.ollama_host = None
 
 # Memory Management Functions
 def load_memory():
@@ -188,6 +216,7 @@ def load_session(session_id):
         st.session_state.conversation_history = session['messages']
         st.session_state.total_interactions = session['total_interactions']
         st.session_state.current_session_id = session_id
+        reset_prompt_layout()
         return True
     return False
 
@@ -197,19 +226,90 @@ def delete_session(session_id):
     sessions = [s for s in sessions if s['id'] != session_id]
     save_memory(sessions)
 
+def reset_prompt_layout():
+    """Reset the prompt window, pinned summary and cache stats"""
+    st.session_state.context_start = 0
+    st.session_state.pinned_summary = []
+    st.session_state.prompt_stats = []
+    st.session_state.cached_context_tokens = 0
+
+def roll_context_window():
+    """Advance the context window in one large step when it grows too long
+
+    Returns True if the window moved (and the cached prefix is invalidated).
+    """
+    history = st.session_state.conversation_history
+    start = st.session_state.context_start
+
+    if len(history) - start <= CONTEXT_WINDOW_MAX:
+        return False
+
+    # Start the new window on a user turn so the turns stay paired
+    new_start = len(history) - CONTEXT_WINDOW_KEEP
+    while new_start < len(history) and history[new_start]['role'] != 'user':
+        new_start += 1
+    if new_start <= start or new_start >= len(history):
+        return False
+
+    # Pin a short note of the dropped topics ahead of the remaining turns
+    for msg in history[start:new_start]:
+        if msg['role'] == 'user':
+            topic = msg['content'].strip()
+            if len(topic) > 80:
+                topic = topic[:77] + "..."
+            st.session_state.pinned_summary.append(topic)
+    st.session_state.pinned_summary = st.session_state.pinned_summary[-SUMMARY_MAX_TOPICS:]
+    st.session_state.context_start = new_start
+    return True
+
 def get_conversation_context():
     """Get conversation context for AI with memory"""
-    context_messages = []
-    
-    # Add conversation history as context
-    for msg in st.session_state.conversation_history[-10:]:  # Last 10 messages for context
+    context_messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+
+    if st.session_state.pinned_summary:
+        context_messages.append({
+            "role": "system",
+            "content": "Earlier in this conversation the user asked about: "
+                       + "; ".join(st.session_state.pinned_summary)
+        })
+
+    # Append-only turns since the last window roll
+    for msg in st.session_state.conversation_history[st.session_state.context_start:]:
         context_messages.append({
             "role": "user" if msg['role'] == 'user' else "assistant",
             "content": msg['content']
         })
-    
+
     return context_messages
 
+def record_prompt_stats(response, rolled):
+    """Record prompt evaluation stats from an Ollama response"""
+    prompt_eval_count = response.get("prompt_eval_count") or 0
+    prompt_eval_duration = response.get("prompt_eval_duration") or 0
+    eval_count = response.get("eval_count") or 0
+
+    # Tokens Ollama did not have to re-evaluate: the previous prompt plus reply,
+    # as long as the prefix was not invalidated (window roll, host switch, memory off)
+    reused_tokens = 0 if rolled else st.session_state.cached_context_tokens
+    if st.session_state.memory_enabled:
+        st.session_state.cached_context_tokens = reused_tokens + prompt_eval_count + eval_count
+    else:
+        # Without memory this prompt is not a prefix of the next one
+        st.session_state.cached_context_tokens = 0
+
+    st.session_state.prompt_stats.append({
+        'prompt_eval_count': prompt_eval_count,
+        'prompt_eval_duration': prompt_eval_duration,
+        'reused_tokens': reused_tokens,
+        'timestamp': datetime.now().strftime("%H:%M:%S")
+    })
+
+# Ollama Host Pool Functions
+@st.cache_resource
+def get_host_pool(hosts):
+    """Create the Ollama host pool shared by all dashboard sessions"""
+    return create_pool(hosts)
+
 # Voice Agent Functions
 def listen():
     """Listen to user voice input"""
@@ -243,30 +343,41 @@ def think(text: str):
     try:
         st.session_state.status = 'thinking'
         
-        # Build messages with context if memory is enabled
-        messages = []
-        
+        # Build a prefix-stable prompt if memory is enabled
+        rolled = False
         if st.session_state.memory_enabled:
-            # Add system message for context awareness
-            context = get_conversation_context()
-            if context:
-                messages.extend(context)
+            rolled = roll_context_window()
+            messages = get_conversation_context()
+        else:
+            rolled = True
+            messages = [{"role": "system", "content": SYSTEM_PROMPT}]
         
-        # Add current user message
-        messages.append({
-            "role": "user",
-            "content": text
-        })
+        # Add current user message unless it is already the last turn
+        if messages[-1] != {"role": "user", "content": text}:
+            messages.append({
+                "role": "user",
+                "content": text
+            })
         
-        response = ollama.chat(
+        previous_host = st.session_state.ollama_host
+        response, host = pooled_chat(
+            get_host_pool(tuple(OLLAMA_HOSTS)),
+            preferred=previous_host,
+            hedge_after=st.session_state.get('hedge_after', 0),
             model="llama3",
-            messages=messages
+            messages=messages,
+            keep_alive=OLLAMA_KEEP_ALIVE
         )
+        st.session_state.ollama_host = host
+        # A different host has none of this conversation cached
+        record_prompt_stats(response, rolled or host != previous_host)
         return response["message"]["content"]
     
     except Exception as e:
+        # The server produced no reply, so its cache does not hold this turn
+        st.session_state.cached_context_tokens = 0
         st.error(f"Error in think(): {e}")
-        return "Sorry, something went wrong while thinking."
+        return None
 
 def speak(text: str):
     """Convert text to speech"""
@@ -313,6 +424,14 @@ with st.sidebar:
     st.subheader("Voice Settings")
     speech_rate = st.slider("Speech Rate", 100, 250, 175)
     
+    # Ollama host settings
+    st.subheader("Ollama Hosts")
+    st.slider(
+        "Hedge After (seconds)", 0.0, 10.0, 0.0, 0.5,
+        key="hedge_after",
+        help="Send a duplicate request to another host if no reply arrives in time (0 = off)"
+    )
+    
     # Timeout settings
     st.subheader("Timeout Settings")
     listen_timeout = st.slider("Listen Timeout (seconds)", 3, 10, 5)
@@ -348,6 +467,7 @@ with st.sidebar:
             st.session_state.total_interactions = 0
             st.session_state.session_start = None
             st.session_state.current_session_id = None
+            reset_prompt_layout()
             st.rerun()
     
     # Display saved sessions
@@ -380,6 +500,7 @@ with st.sidebar:
             os.remove(MEMORY_FILE)
         st.session_state.conversation_history = []
         st.session_state.total_interactions = 0
+        reset_prompt_layout()
         st.success("All history cleared!")
         st.rerun()
 
@@ -456,6 +577,10 @@ with col1:
                         # Auto-save after each interaction if memory enabled
                         if st.session_state.memory_enabled:
                             save_current_session()
+                    else:
+                        # Keep the apology out of the history so later prompts
+                        # don't carry a reply the model never gave
+                        speak("Sorry, something went wrong while thinking.")
                 
                 st.session_state.status = 'idle'
                 st.rerun()
@@ -477,6 +602,7 @@ with col1:
             st.session_state.session_start = None
             st.session_state.status = 'idle'
             st.session_state.current_session_id = None
+            reset_prompt_layout()
             st.rerun()
     
     st.divider()
@@ -539,6 +665,21 @@ with col2:
     st.metric("Saved Sessions", total_sessions)
     st.markdown('</div>', unsafe_allow_html=True)
     
+    # Prompt cache stats
+    if st.session_state.prompt_stats:
+        evaluated = sum(s['prompt_eval_count'] for s in st.session_state.prompt_stats)
+        reused = sum(s['reused_tokens'] for s in st.session_state.prompt_stats)
+        eval_ms = sum(s['prompt_eval_duration'] for s in st.session_state.prompt_stats) / 1e6
+        saved_pct = 100 * reused / (reused + evaluated) if reused + evaluated else 0
+        
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        st.metric("Prompt Tokens Evaluated", evaluated, help=f"{eval_ms:.0f} ms spent on prompt evaluation")
+        st.markdown('</div>', unsafe_allow_html=True)
+        
+        st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+        st.metric("Prompt Cache Saved (est.)", f"{saved_pct:.0f}%", help=f"Estimated ~{reused} tokens reused from Ollama's KV cache")
+        st.markdown('</div>', unsafe_allow_html=True)
+    
     st.divider()
     
     st.subheader("ℹ️ Instructions")
@@ -571,6 +712,12 @@ with col2:
         st.write("**Phrase Limit:**", f"{phrase_limit}s")
         st.write("**Status:**", st.session_state.status.upper())
         st.write("**Session ID:**", st.session_state.current_session_id or "Not started")
+        st.write("**Ollama Host:**", st.session_state.ollama_host or "Default")
+        
+        pool = get_host_pool(tuple(OLLAMA_HOSTS))
+        for host, state in pool['hosts'].items():
+            health = "🟢" if state['healthy'] else "🔴"
+            st.write(f"{health} `{host or 'default'}` — {state['outstanding']} in flight, {state['errors']} errors")
 
 # Footer
 st.divider()
@@ -0,0 +1,201 @@
+"""Check the Ollama host pool against local stand-in servers
+
+Run with: python check_ollama_pool.py
+No real Ollama install is needed; each stand-in answers /api/tags and /api/chat.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ollama
+
+from ollama_pool import configured_hosts, create_pool, close_pool, pooled_chat, probe_hosts
+
+
+def start_stand_in(name, delay=0, status=200):
+    """Start a fake Ollama server that answers chats after a delay with a status code"""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def reply(self, code, body):
+            data = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self.reply(200, {"models": []})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(delay)
+            if status != 200:
+                self.reply(status, {"error": f"{name} returned {status}"})
+                return
+            self.reply(200, {
+                "model": "llama3",
+                "created_at": "2024-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": f"hello from {name}"},
+                "done": True,
+                "prompt_eval_count": 10,
+                "eval_count": 5
+            })
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def dead_host():
+    """Return the address of a port nothing is listening on"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BaseHTTPRequestHandler)
+    address = f"http://127.0.0.1:{server.server_address[1]}"
+    server.server_close()
+    return address
+
+
+def chat(pool, **kwargs):
+    return pooled_chat(pool, model="llama3", messages=[{"role": "user", "content": "hi"}], **kwargs)
+
+
+def check_failover():
+    _, broken = start_stand_in("broken", status=500)
+    _, fast = start_stand_in("fast")
+    pool = create_pool([broken, fast], health_check_interval=60)
+    response, host = chat(pool, preferred=broken)
+    assert host == fast and response["message"]["content"] == "hello from fast"
+    assert pool['hosts'][broken]['errors'] == 1
+    close_pool(pool)
+
+
+def check_bad_request_does_not_fail_over():
+    _, bad = start_stand_in("bad", status=400)
+    _, fast = start_stand_in("fast")
+    pool = create_pool([bad, fast], health_check_interval=60)
+    try:
+        chat(pool, preferred=bad)
+        raise AssertionError("expected a ResponseError")
+    except ollama.ResponseError as e:
+        assert e.status_code == 400
+    assert pool['hosts'][bad]['healthy'] and pool['hosts'][fast]['outstanding'] == 0
+    close_pool(pool)
+
+
+def check_client_error_keeps_pool_healthy():
+    _, a = start_stand_in("a")
+    _, b = start_stand_in("b")
+    pool = create_pool([a, b], health_check_interval=60)
+    for bad_request in ({"model": ""}, {"bogus": 1}):
+        try:
+            pooled_chat(pool, **{"model": "llama3", "messages": [], **bad_request})
+            raise AssertionError(f"expected {bad_request} to raise")
+        except AssertionError:
+            raise
+        except Exception:
+            pass
+    for host in (a, b):
+        state = pool['hosts'][host]
+        assert state['healthy'] and state['errors'] == 0, (host, state)
+    close_pool(pool)
+
+
+def check_missing_model_fails_over():
+    _, missing = start_stand_in("missing", status=404)
+    _, fast = start_stand_in("fast")
+    pool = create_pool([missing, fast], health_check_interval=60)
+    _, host = chat(pool, preferred=missing)
+    assert host == fast
+    assert pool['hosts'][missing]['healthy'] and "llama3:latest" in pool['hosts'][missing]['missing_models']
+    # New and pinned sessions now go to the host that has the model first
+    assert chat(pool)[1] == fast and chat(pool, preferred=missing)[1] == fast
+    close_pool(pool)
+
+
+def check_health_probe():
+    down = dead_host()
+    _, fast = start_stand_in("fast")
+    pool = create_pool([down, fast], health_check_interval=60)
+    probe_hosts(pool)
+    assert not pool['hosts'][down]['healthy'] and pool['hosts'][fast]['healthy']
+    _, host = chat(pool, preferred=down)
+    assert host == fast
+    close_pool(pool)
+
+
+def check_affinity():
+    _, a = start_stand_in("a")
+    _, b = start_stand_in("b")
+    pool = create_pool([a, b], health_check_interval=60)
+    for _ in range(3):
+        assert chat(pool, preferred=b)[1] == b
+    close_pool(pool)
+
+
+def check_least_outstanding():
+    _, a = start_stand_in("a", delay=1)
+    _, b = start_stand_in("b", delay=1)
+    pool = create_pool([a, b], health_check_interval=60)
+    sessions = 6
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        hosts = list(executor.map(lambda _: chat(pool)[1], range(sessions)))
+    elapsed = time.time() - start
+    assert hosts.count(a) == hosts.count(b) == sessions // 2, hosts
+    assert elapsed < 1.8, elapsed
+    close_pool(pool)
+
+
+def check_hedging():
+    _, slow = start_stand_in("slow", delay=1.5)
+    _, fast = start_stand_in("fast")
+    pool = create_pool([slow, fast], health_check_interval=60)
+    start = time.time()
+    _, host = chat(pool, preferred=slow, hedge_after=0.2)
+    assert host == fast and time.time() - start < 1, time.time() - start
+    # The abandoned request still counts against the slow host until it finishes
+    assert pool['hosts'][slow]['outstanding'] == 1
+    time.sleep(1.5)
+    assert pool['hosts'][slow]['outstanding'] == 0
+    close_pool(pool)
+
+
+def check_configured_hosts():
+    saved = {k: os.environ.pop(k, None) for k in ("OLLAMA_HOSTS", "OLLAMA_HOST")}
+    try:
+        assert configured_hosts() == [None]
+        os.environ["OLLAMA_HOSTS"] = ","
+        assert configured_hosts() == [None]
+        del os.environ["OLLAMA_HOSTS"]
+        os.environ["OLLAMA_HOST"] = "http://remote:11434"
+        assert configured_hosts() == ["http://remote:11434"]
+        os.environ["OLLAMA_HOSTS"] = "http://a:11434, http://b:11434"
+        assert configured_hosts() == ["http://a:11434", "http://b:11434"]
+    finally:
+        for k, v in saved.items():
+            os.environ.pop(k, None)
+            if v is not None:
+                os.environ[k] = v
+
+
+if __name__ == "__main__":
+    checks = [
+        check_failover,
+        check_bad_request_does_not_fail_over,
+        check_client_error_keeps_pool_healthy,
+        check_missing_model_fails_over,
+        check_health_probe,
+        check_affinity,
+        check_least_outstanding,
+        check_hedging,
+        check_configured_hosts
+    ]
+    for check in checks:
+        check()
+        print(f"ok  {check.__name__}")
+    print("All pool checks passed")
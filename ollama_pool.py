@@ -0,0 +1,200 @@
+import os
+import threading
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+import httpx
+import ollama
+
+# Ollama host pool settings
+HEALTH_CHECK_INTERVAL = 15  # seconds between background probes
+HEALTH_CHECK_TIMEOUT = 2
+REQUEST_TIMEOUT = 120
+AFFINITY_SLACK = 1  # extra outstanding requests tolerated to stay on the same host
+
+
+def configured_hosts():
+    """Read the Ollama hosts to use from the environment
+
+    OLLAMA_HOSTS takes a comma-separated list of servers. Without it, falls back
+    to OLLAMA_HOST, and then to the library default (None).
+    """
+    value = os.environ.get("OLLAMA_HOSTS") or os.environ.get("OLLAMA_HOST") or ""
+    hosts = [h.strip() for h in value.split(",") if h.strip()]
+    return hosts or [None]
+
+
+def create_pool(hosts, health_check_interval=HEALTH_CHECK_INTERVAL):
+    """Create a pool of Ollama hosts and start its background health checks"""
+    pool = {
+        'lock': threading.Lock(),
+        'stop': threading.Event(),
+        'hosts': {
+            host: {
+                'client': ollama.Client(host=host, timeout=REQUEST_TIMEOUT),
+                'probe_client': ollama.Client(host=host, timeout=HEALTH_CHECK_TIMEOUT),
+                'healthy': True,
+                'outstanding': 0,
+                'errors': 0,
+                'missing_models': set()
+            }
+            for host in hosts
+        }
+    }
+
+    def probe_loop():
+        while True:
+            probe_hosts(pool)
+            if pool['stop'].wait(health_check_interval):
+                break
+
+    threading.Thread(target=probe_loop, daemon=True).start()
+    return pool
+
+
+def close_pool(pool):
+    """Stop the pool's background health checks"""
+    pool['stop'].set()
+
+
+def probe_host(pool, host):
+    """Check whether one host is reachable and which models it has pulled"""
+    state = pool['hosts'][host]
+    try:
+        available = {model_name(m.model) for m in state['probe_client'].list().models if m.model}
+        healthy = True
+    except Exception:
+        available = set()
+        healthy = False
+    with pool['lock']:
+        state['healthy'] = healthy
+        state['missing_models'] -= available
+
+
+def probe_hosts(pool):
+    """Probe every host in parallel"""
+    threads = [
+        threading.Thread(target=probe_host, args=(pool, host), daemon=True)
+        for host in pool['hosts']
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def model_name(name):
+    """Normalize a model name so "llama3" and "llama3:latest" match"""
+    return name if ":" in name else f"{name}:latest"
+
+
+def is_host_failure(error):
+    """Tell host problems (connection, timeout, 5xx) apart from request errors"""
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500
+    return isinstance(error, (ConnectionError, httpx.TransportError))
+
+
+def is_missing_model(error):
+    """Tell whether a host answered 404 because it has not pulled the model"""
+    return isinstance(error, ollama.ResponseError) and error.status_code == 404
+
+
+def rank_hosts(pool, preferred=None, model=None):
+    """Order hosts by outstanding requests, keeping the preferred host first if not overloaded
+
+    Hosts known to be missing the model are tried last.
+    """
+    wanted = model_name(model) if model else None
+    with pool['lock']:
+        healthy = [h for h, state in pool['hosts'].items() if state['healthy']]
+        # If every host looks down, try them all anyway
+        candidates = healthy or list(pool['hosts'])
+        ranked = sorted(candidates, key=lambda h: (
+            wanted in pool['hosts'][h]['missing_models'],
+            pool['hosts'][h]['outstanding']
+        ))
+
+        # Session affinity keeps the host's KV cache warm for this conversation
+        if preferred in ranked and wanted not in pool['hosts'][preferred]['missing_models']:
+            least = pool['hosts'][ranked[0]]['outstanding']
+            if pool['hosts'][preferred]['outstanding'] <= least + AFFINITY_SLACK:
+                ranked.remove(preferred)
+                ranked.insert(0, preferred)
+
+    return ranked
+
+
+def start_request(pool, host, request):
+    """Send a chat request to one host on its own thread and return a Future
+
+    The request counts as outstanding on the host from submission until it
+    finishes, even if the caller has stopped waiting for it.
+    """
+    state = pool['hosts'][host]
+    future = Future()
+    with pool['lock']:
+        state['outstanding'] += 1
+
+    def run():
+        response, error = None, None
+        try:
+            response = state['client'].chat(**request)
+        except Exception as e:
+            error = e
+        with pool['lock']:
+            state['outstanding'] -= 1
+            if error is not None and is_host_failure(error):
+                state['healthy'] = False
+                state['errors'] += 1
+            elif error is not None and is_missing_model(error) and request.get('model'):
+                state['missing_models'].add(model_name(request['model']))
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(response)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def pooled_chat(pool, preferred=None, hedge_after=0, **request):
+    """Chat via the host pool with affinity, optional hedging and failover
+
+    Returns (response, host). If hedge_after is set, a duplicate request is sent
+    to the next best host when the first has not answered within that many
+    seconds, and whichever answers first wins. Host failures and hosts missing
+    the model fail over to the next host; other errors are raised straight away.
+    """
+    candidates = rank_hosts(pool, preferred, request.get('model'))
+
+    pending = {}
+    last_error = None
+
+    def launch():
+        host = candidates.pop(0)
+        pending[start_request(pool, host, request)] = host
+
+    launch()
+    while pending:
+        can_hedge = hedge_after and candidates and len(pending) < 2
+        done, _ = wait(pending, timeout=hedge_after if can_hedge else None, return_when=FIRST_COMPLETED)
+
+        if not done:
+            # First host is slow; hedge with a duplicate request
+            launch()
+            continue
+
+        for future in done:
+            host = pending.pop(future)
+            try:
+                return future.result(), host
+            except Exception as e:
+                if not (is_host_failure(e) or is_missing_model(e)):
+                    raise
+                last_error = e
+
+        # Everything that finished failed; fail over to the next host
+        if not pending and candidates:
+            launch()
+
+    raise last_error